@@ -52,6 +52,7 @@ setup(
         "six",
         "sparsecomputation",
         "scipy",
+        "tifffile",
         "tqdm",
     ],  # required packages here
 )
@@ -23,6 +23,8 @@
 # ENHANCEMENTS, OR MODIFICATIONS.
 """HNCcorr components related to the similarity graph."""
 
+import math
+
 import networkx as nx
 import numpy as np
 from sparsecomputation import SparseComputation as SC
@@ -57,7 +59,7 @@ class CorrelationEmbedding:
             patch (Patch): Subregion of movie for which the correlation embedding is
                 computed.
         """
-        data = patch[:].reshape(-1, np.product(patch.pixel_shape))
+        data = patch[:].reshape(-1, math.prod(patch.pixel_shape))
         self.embedding = np.corrcoef(data.T).reshape(-1, *patch.pixel_shape)
         self.embedding[np.isnan(self.embedding)] = 0
 
@@ -174,7 +176,7 @@ class SparseComputationEmbeddingWrapper:
             list(tuple): List of relevant pixel pairs.
         """
         shape = embedding.embedding.shape[1:]
-        data = embedding.embedding.reshape(-1, np.product(shape)).T
+        data = embedding.embedding.reshape(-1, math.prod(shape)).T
 
         pairs = self._sc.select_pairs(data)
 
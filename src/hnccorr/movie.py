@@ -23,18 +23,24 @@
 # ENHANCEMENTS, OR MODIFICATIONS.
 """Components for calcium-imaging movies in HNCcorr."""
 
+import io
+import itertools
 import os
 import math
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
+import tifffile
 from PIL import Image
-from PIL.TiffTags import TAGS
 
 from hnccorr.utils import (
-    add_offset_to_coordinate,
-    add_offset_set_coordinates,
+    add_offset_function,
     add_time_index,
-    generate_pixels,
+    advise_memory_access,
+    advise_sequential_access,
     list_images,
+    valid_pixels_mask,
 )
 
 
@@ -44,21 +50,57 @@ class Movie:
     Data is stored in an in-memory numpy array. Class supports both 2- and 3-
     dimensional movies.
 
+    The layout determines how the data is stored. With layout ``"TYX"`` the data is
+    stored as provided with time as the first axis. With layout ``"YXT"`` a copy of the
+    data is stored with time as the last axis, such that the time series of each pixel
+    is contiguous in memory. This speeds up computations that access the data pixel by
+    pixel, such as correlations. The movie is always indexed with time as the first
+    axis, regardless of the layout.
+
     Attributes:
         name(str): Name of the experiment.
-        _data (np.array): Fluorescence data. Array has size T x N1 x N2. T is
-            the number of frame (num_frames), N1 and N2 are the number of
-            pixels in the first and second dimension respectively.
-        _data_size (tuple): Size of array _data.
+        layout (str): Storage layout of the data. Either ``"TYX"`` or ``"YXT"``.
+        _data (np.array): Fluorescence data. Array has size T x N1 x N2 for layout
+            ``"TYX"`` and N1 x N2 x T for layout ``"YXT"``. T is the number of frame
+            (num_frames), N1 and N2 are the number of pixels in the first and second
+            dimension respectively.
+        _frames (np.array): View of `_data` with time as the first axis.
+        _num_dimensions (int): Dimension of the movie (excludes time dimension).
+        _num_pixels (int): Number of pixels in the movie.
+        _pixel_shape (tuple): Resolution of the movie in pixels.
+        data_size (tuple): Size of the movie with time as the first axis.
     """
 
-    def __init__(self, name, data):
+    def __init__(self, name, data, layout="TYX"):
+        if layout not in ("TYX", "YXT"):
+            raise ValueError("layout (%s) should be 'TYX' or 'YXT'." % layout)
+
         self.name = name
-        self._data = data
+        self.layout = layout
+        if layout == "YXT":
+            self._data = np.ascontiguousarray(np.moveaxis(data, 0, -1))
+            self._frames = np.moveaxis(self._data, -1, 0)
+        else:
+            self._data = data
+            self._frames = data
         self.data_size = data.shape
 
+        # cached as they are accessed for every pixel coordinate that is checked
+        self._pixel_shape = tuple(self.data_size[1:])
+        self._num_dimensions = len(self._pixel_shape)
+        self._num_pixels = math.prod(self._pixel_shape)
+
     @classmethod
-    def from_tiff_images(cls, name, image_dir, num_images, memmap=False, subsample=10):
+    def from_tiff_images(
+        cls,
+        name,
+        image_dir,
+        num_images,
+        memmap=False,
+        subsample=10,
+        layout="TYX",
+        dtype=np.float32,
+    ):
         """Loads tiff images into a numpy array.
 
         Data is assumed to be stored in 16-bit unsigned integers. Frame numbers are
@@ -76,12 +118,29 @@ class Movie:
             num_images (int): Number of images in the folder.
             memmap (bool): If True, a memory-mapped file is used. (*Default: False*)
             subsample (int): Number of frames to average into a single frame.
+            layout (str): Storage layout of the movie. See :class:`Movie`. Layout
+                ``"YXT"`` copies the data into memory, also if `memmap` is True.
+                (*Default: "TYX"*)
+            dtype (np.dtype): Data type used to store the averaged frames. Integer
+                data types, e.g. ``np.uint16``, reduce memory usage and bandwidth and
+                store rounded averages, clipped to the range of the data type.
+                Floating point data types must have at least 32 bits.
+                (*Default: np.float32*)
 
         Returns:
             Movie: Movie created from image files.
+
+        Raises:
+            ValueError: If `dtype` is a floating point type with less than 32 bits.
         """
+        if np.issubdtype(dtype, np.floating) and np.finfo(dtype).bits < 32:
+            raise ValueError(
+                "dtype (%s) should have at least 32 bits." % np.dtype(dtype)
+            )
 
-        images, data_size = cls._get_tiff_images_and_size(image_dir, num_images)
+        images, data_size, first_frame = cls._get_tiff_images_and_size(
+            image_dir, num_images
+        )
 
         subsampler = Subsampler(data_size, subsample)
 
@@ -89,21 +148,72 @@ class Movie:
             memmap_filename = os.path.join(image_dir, name + ".npy")
             data = np.memmap(
                 memmap_filename,
-                dtype=np.float32,
+                dtype=dtype,
                 mode="w+",
                 shape=subsampler.output_shape,
             )
+            advise_memory_access(data, "sequential")
+        else:
+            # every frame is overwritten by _read_images so no need to initialize
+            data = np.empty(subsampler.output_shape, dtype)
+
+        cls._read_images(
+            images, data, subsampler, os.cpu_count() or 1, first_frame=first_frame
+        )
+
+        return cls(name, data, layout)
+
+    @classmethod
+    def from_raw(cls, name, path, shape, dtype=np.float32, memmap=False, layout="TYX"):
+        """Loads a movie from a raw binary file.
+
+        The file should contain the movie data without header in C order with time as
+        the first axis. Such files are written by :meth:`~.Movie.cache_to_raw` and by
+        :meth:`~.Movie.from_tiff_images` if `memmap` is True. Loading a single raw file
+        is much faster than decoding a folder of tiff images.
+
+        Args:
+            name (str): Movie name.
+            path (str): Path of the raw file.
+            shape (tuple): Shape of the movie data (T, N_1, N_2).
+            dtype (np.dtype): Data type of the movie data. (*Default: np.float32*)
+            memmap (bool): If True, the file is memory-mapped in read-only mode instead
+                of loaded into memory. (*Default: False*)
+            layout (str): Storage layout of the movie. See :class:`Movie`.
+                (*Default: "TYX"*)
+
+        Returns:
+            Movie: Movie created from the raw file.
+        """
+        if memmap:
+            data = np.memmap(path, dtype=dtype, mode="r", shape=tuple(shape))
         else:
-            data = np.zeros(subsampler.output_shape, np.float32)
+            data = np.fromfile(path, dtype=dtype).reshape(shape)
+
+        return cls(name, data, layout)
 
-        cls._read_images(images, data, subsampler)
+    def cache_to_raw(self, path):
+        """Writes the movie data to a raw binary file.
 
-        return cls(name, data)
+        The data is written without header in C order with time as the first axis,
+        regardless of the layout. The movie can be loaded again with
+        :meth:`~.Movie.from_raw` with shape `data_size` and data type `dtype`.
+
+        Args:
+            path (str): Path of the raw file.
+
+        Returns:
+            None
+        """
+        self._frames.tofile(path)
 
     @staticmethod
     def _get_tiff_images_and_size(image_dir, num_images):
         """ Provides a sorted list of images and computes the required array size.
 
+        The array size is derived from the first image. The decoded first image is
+        returned as well, such that it does not need to be read again.
+
         Data is assumed to be stored in 16-bit unsigned integers. Frame numbers are
         assumed to be padded with zeros: 00000, 00001, 00002, etc. This is required
         such that Python sorts the images correctly. Frame numbers can start from 0, 1,
@@ -114,51 +224,173 @@ class Movie:
             num_images (int): Number of images in the folder.
 
         Returns:
-            tuple[List[Str], tuple]: Tuple of the list of images and the array size.
+            tuple[List[Str], tuple, np.array]: Tuple of the list of images, the array
+            size, and the first image.
         """
         images = list_images(image_dir)
 
         assert len(images) == num_images
 
-        # read image meta data
-        first_image = images[0]
-        with Image.open(first_image) as image:
-            meta = {TAGS[key]: image.tag[key] for key in image.tag}
-
-        # set size of data
-        data_size = (len(images), meta["ImageLength"][0], meta["ImageWidth"][0])
+        first_frame = Movie._decode_frame(Movie._read_file(images[0]))
+        data_size = (len(images), *first_frame.shape)
 
-        return images, data_size
+        return images, data_size, first_frame
 
     @staticmethod
-    def _read_images(images, output_array, subsampler):
+    def _read_images(images, output_array, subsampler, num_workers=1, first_frame=None):
         """ Loads images and copies them into the provided array.
 
+        Images are read and decoded concurrently, but are added to the subsampler in
+        order. See :meth:`~.Movie._decode_images`.
+
         Args:
             images (list[Str]): Sorted list image paths.
             output_array (np.array like): T x N_1 x N_2 array-like object into which
                 images should be loaded. T must equal the number of images in `images`.
                 Each image should be of size N_1 x N_2.
-            subsampler
+            subsampler (Subsampler): Subsampler that averages the images.
+            num_workers (int): Number of threads used to decode images. (*Default: 1*)
+            first_frame (np.array): Decoded first image. If provided, the first image in
+                `images` is not read again. (*Default: None*)
 
         Returns:
             np.array like: The input array `array`.
 
         """
-        for filename in images:
+        if first_frame is None:
+            frames = Movie._decode_images(images, num_workers)
+        else:
+            frames = itertools.chain(
+                [first_frame], Movie._decode_images(images[1:], num_workers)
+            )
+
+        for frame in frames:
             if subsampler.buffer_full:
-                output_array[
-                    slice(*subsampler.buffer_indices), :, :
-                ] = subsampler.buffer
+                Movie._write_buffer(output_array, subsampler)
                 subsampler.advance_buffer()
 
-            with Image.open(filename) as image:
-                subsampler.add_frame(np.array(image))
+            subsampler.add_frame(frame)
 
-        output_array[slice(*subsampler.buffer_indices), :, :] = subsampler.buffer
+        Movie._write_buffer(output_array, subsampler)
 
         return output_array
 
+    @staticmethod
+    def _write_buffer(output_array, subsampler):
+        """ Copies the averaged frames in the subsampler buffer to the output array.
+
+        Averages are rounded and clipped to the range of the data type if the output
+        array has an integer data type.
+
+        Args:
+            output_array (np.array like): Array into which the averaged frames are
+                written. See :meth:`~.Movie._read_images`.
+            subsampler (Subsampler): Subsampler that averages the images.
+
+        Returns:
+            None
+        """
+        buffer = subsampler.buffer
+        if np.issubdtype(output_array.dtype, np.integer):
+            info = np.iinfo(output_array.dtype)
+            buffer = np.clip(np.rint(buffer), info.min, info.max)
+
+        output_array[slice(*subsampler.buffer_indices), :, :] = buffer
+
+    @staticmethod
+    def _decode_images(images, num_workers):
+        """ Reads and decodes images in a pipeline and yields them in order.
+
+        A single reader thread reads the images from disk in order, while
+        `num_workers` threads decode the images that have been read. Reading, decoding
+        and consuming the images thus overlap. At most ``max(4, 2 * num_workers)``
+        images are read ahead of the consumer, such that memory usage does not grow
+        with the length of the movie.
+
+        Images are decoded into a fixed set of frame buffers that are reused for later
+        images. A yielded frame is therefore only valid until the next frame is
+        requested.
+
+        Args:
+            images (list[Str]): Sorted list image paths.
+            num_workers (int): Number of threads used to decode images.
+
+        Yields:
+            np.array: N_1 x N_2 array with the pixel intensities of the next image.
+        """
+        read_ahead = max(4, 2 * num_workers)
+
+        # A buffer is reused once the consumer has requested the frame after it, which
+        # leaves at most read_ahead + 1 frames in use at any time.
+        buffers = [None] * (read_ahead + 1)
+
+        def decode(contents, slot):
+            buffers[slot] = Movie._decode_frame(contents.result(), out=buffers[slot])
+            return buffers[slot]
+
+        with ThreadPoolExecutor(max_workers=1) as reader, ThreadPoolExecutor(
+            max_workers=num_workers
+        ) as decoder:
+            pending = deque()
+            for index, filename in enumerate(images):
+                contents = reader.submit(Movie._read_file, filename)
+                pending.append(decoder.submit(decode, contents, index % len(buffers)))
+                if len(pending) > read_ahead:
+                    yield pending.popleft().result()
+
+            while pending:
+                yield pending.popleft().result()
+
+    @staticmethod
+    def _read_file(filename):
+        """ Reads the raw contents of an image file.
+
+        Args:
+            filename (str): Path of tiff image.
+
+        Returns:
+            bytes: Contents of the file.
+        """
+        with open(filename, "rb") as file:
+            advise_sequential_access(file)
+            return file.read()
+
+    @staticmethod
+    def _decode_frame(contents, out=None):
+        """ Decodes a single tiff image into a numpy array.
+
+        Single-page 16-bit images are decoded directly with tifffile. These images are
+        decoded into `out` if it is a writable array of the right shape and data type.
+        Other images, and images that tifffile cannot decode without optional codecs
+        (e.g. LZW compression), fall back to Pillow.
+
+        Args:
+            contents (bytes): Raw contents of a tiff image file.
+            out (np.array): Optional buffer to decode the image into. (*Default: None*)
+
+        Returns:
+            np.array: N_1 x N_2 array with the pixel intensities of the image.
+        """
+        with tifffile.TiffFile(io.BytesIO(contents)) as tiff:
+            page = tiff.pages[0]
+            if len(tiff.pages) == 1 and page.dtype == np.uint16:
+                if (
+                    out is None
+                    or out.shape != page.shape
+                    or out.dtype != page.dtype
+                    or not out.flags.writeable
+                ):
+                    out = None
+                try:
+                    return page.asarray(out=out)
+                except ValueError:
+                    # compression requires the optional imagecodecs package
+                    pass
+
+        with Image.open(io.BytesIO(contents)) as image:
+            # asarray wraps the decoded buffer without making another copy
+            return np.asarray(image)
+
     def __getitem__(self, key):
         """Provides direct access to the movie data.
 
@@ -172,18 +404,32 @@ class Movie:
         Returns:
             np.array
         """
-        return self._data.__getitem__(key).astype(np.float64)
+        return self._frames.__getitem__(key).astype(np.float64)
+
+    def set_access_pattern(self, pattern):
+        """Informs the operating system how the movie data will be accessed.
+
+        Only affects memory-mapped movies. Use ``"sequential"`` for passes over the
+        full movie and ``"random"`` for scattered access, e.g. when extracting patches.
+
+        Args:
+            pattern (str): Access pattern. Either ``"sequential"`` or ``"random"``.
+
+        Returns:
+            None
+        """
+        advise_memory_access(self._data, pattern)
 
     def is_valid_pixel_coordinate(self, coordinate):
         """Checks if coordinate is a coordinate for a pixel in the movie."""
-        if self.num_dimensions != len(coordinate):
+        if self._num_dimensions != len(coordinate):
             return False
+        return all(0 <= i < n for i, n in zip(coordinate, self._pixel_shape))
 
-        zero_tuple = (0,) * self.num_dimensions
-        for i, lower, upper in zip(coordinate, zero_tuple, self.pixel_shape):
-            if not lower <= i < upper:
-                return False
-        return True
+    @property
+    def dtype(self):
+        """Data type in which the movie data is stored."""
+        return self._data.dtype
 
     @property
     def num_frames(self):
@@ -193,21 +439,31 @@ class Movie:
     @property
     def pixel_shape(self):
         """Resolution of the movie in pixels."""
-        return self.data_size[1:]
+        return self._pixel_shape
 
     @property
     def num_pixels(self):
         """Number of pixels in the movie."""
-        return np.product(self.data_size[1:])
+        return self._num_pixels
 
     @property
     def num_dimensions(self):
         """Dimension of the movie (excludes time dimension)."""
-        return len(self.data_size[1:])
+        return self._num_dimensions
 
     def extract_valid_pixels(self, pixels):
-        """Returns subset of pixels that are valid coordinates for the movie."""
-        return {pixel for pixel in pixels if self.is_valid_pixel_coordinate(pixel)}
+        """Returns subset of pixels that are valid coordinates for the movie.
+
+        Pixels with the wrong number of dimensions are invalid. The bounds of the
+        remaining pixels are checked at once with numpy.
+        """
+        pixels = [pixel for pixel in pixels if len(pixel) == self._num_dimensions]
+        if not pixels:
+            return set()
+
+        coordinates = np.array(pixels, dtype=np.intp)
+        valid = valid_pixels_mask(coordinates, self._pixel_shape)
+        return {pixel for pixel, is_valid in zip(pixels, valid) if is_valid}
 
 
 class Patch:
@@ -224,14 +480,18 @@ class Patch:
     coordinate system.
 
     Attributes:
+        _add_offset (function): Coordinate addition specialized to the patch dimension.
         _center_seed (tuple): Seed pixel that marks the potential cell. The pixel is
             represented as a tuple of coordinates. The coordinates are relative to the
             movie. The top left pixel of the movie represents zero.
         _coordinate_offset (tuple): Movie coordinates of the pixel that represents the
             zero coordinate in the Patch object. Similar to the Movie, pixels in the
             Patch are indexed from the top left corner.
+        _negative_offset (tuple): Negation of `_coordinate_offset`.
         _data (np.array): Subset of the Movie data. Only data for the patch is stored.
+            The data is loaded from the movie on first access.
         _movie (Movie): Movie for which the Patch object is a subregion.
+        _movie_index (tuple): Index of the movie data corresponding to the patch.
         _num_dimensions (int): Dimension of the patch. It matches the dimension of the
             movie.
         _patch_size (int): length of the patch in each dimension. Must be an odd number.
@@ -243,11 +503,14 @@ class Patch:
             raise ValueError("patch_size (%d) should be an odd number.")
 
         self._num_dimensions = movie.num_dimensions
+        self._add_offset = add_offset_function(self._num_dimensions)
         self._center_seed = center_seed
         self._patch_size = patch_size
         self._movie = movie
         self._coordinate_offset = self._compute_coordinate_offset()
-        self._data = self._movie[self._movie_indices()]
+        self._negative_offset = tuple(-x for x in self._coordinate_offset)
+        self._movie_index = self._movie_indices()
+        self._data = None
 
     @property
     def num_frames(self):
@@ -266,29 +529,22 @@ class Patch:
         if necessary. The center seed pixel may not be in the center of the patch if a
         shift is necessary.
         """
-        half_width = int((self._patch_size - 1) / 2)
+        half_width = (self._patch_size - 1) // 2
+        center_seed = np.asarray(self._center_seed, dtype=np.intp)
+        pixel_shape = np.asarray(self._movie.pixel_shape, dtype=np.intp)
 
-        topleft_coordinates = add_offset_to_coordinate(
-            self._center_seed, (-half_width,) * self._num_dimensions
-        )
         # shift left such that top left corner exists
-        topleft_coordinates = list(max(x, 0) for x in topleft_coordinates)
+        topleft_coordinates = np.maximum(center_seed - half_width, 0)
 
         # bottomright corners (python-style index so not included)
-        bottomright_coordinates = add_offset_to_coordinate(
-            topleft_coordinates, (self._patch_size,) * self._num_dimensions
-        )
         # shift right such that bottom right corner exists
-        bottomright_coordinates = list(
-            min(x, max_value)
-            for x, max_value in zip(bottomright_coordinates, self._movie.pixel_shape)
+        bottomright_coordinates = np.minimum(
+            topleft_coordinates + self._patch_size, pixel_shape
         )
 
-        topleft_coordinates = add_offset_to_coordinate(
-            bottomright_coordinates, (-self._patch_size,) * self._num_dimensions
-        )
+        topleft_coordinates = bottomright_coordinates - self._patch_size
 
-        return topleft_coordinates
+        return tuple(topleft_coordinates.tolist())
 
     def _movie_indices(self):
         """Computes the indices of the movie that correspond to the patch.
@@ -297,15 +553,11 @@ class Patch:
         method returns ``(:, 5:10, 5:10)`` which can be used to acccess the data
         corresponding to the patch in the movie.
         """
-        bottomright_coordinates = add_offset_to_coordinate(
-            self._coordinate_offset, (self._patch_size,) * self._num_dimensions
-        )
-
         # pixel indices
-        idx = []
-        for start, stop in zip(self._coordinate_offset, bottomright_coordinates):
-            idx.append(slice(start, stop))
-        return add_time_index(tuple(idx))
+        idx = tuple(
+            slice(start, start + self._patch_size) for start in self._coordinate_offset
+        )
+        return add_time_index(idx)
 
     def to_movie_coordinate(self, patch_coordinate):
         """Converts a movie coordinate into a patch coordinate.
@@ -316,7 +568,7 @@ class Patch:
         Returns:
             tuple: Coordinate of pixel in movie coordinate system.
         """
-        return add_offset_to_coordinate(patch_coordinate, self._coordinate_offset)
+        return self._add_offset(patch_coordinate, self._coordinate_offset)
 
     def to_patch_coordinate(self, movie_coordinate):
         """Converts a movie coordinate into a patch coordinate.
@@ -327,18 +579,19 @@ class Patch:
         Returns:
             tuple: Coordinate of pixel in patch coordinate system.
         """
-        return add_offset_to_coordinate(
-            movie_coordinate, [-x for x in self._coordinate_offset]
-        )
+        return self._add_offset(movie_coordinate, self._negative_offset)
 
     def enumerate_pixels(self):
         """Returns the movie coordinates of the pixels in the patch."""
-        return add_offset_set_coordinates(
-            generate_pixels(self.pixel_shape), self._coordinate_offset
-        )
+        # (num_pixels, num_dimensions) array of patch coordinates
+        coordinates = np.indices(self.pixel_shape).reshape(self._num_dimensions, -1).T
+        coordinates += np.asarray(self._coordinate_offset, dtype=coordinates.dtype)
+        return set(map(tuple, coordinates.tolist()))
 
     def __getitem__(self, key):
         """Access data for pixels in the patch. Indexed in patch coordinates."""
+        if self._data is None:
+            self._data = self._movie[self._movie_index]
         return self._data[key]
 
 
@@ -32,6 +32,7 @@ from hnccorr.utils import (
     add_time_index,
     eight_neighborhood,
     generate_pixels,
+    valid_pixels_mask,
 )
 
 
@@ -52,7 +53,8 @@ class LocalCorrelationSeeder:
 
     Attributes:
         _current_index (int): Index of next seed in `_seeds` to return.
-        _excluded_pixels (set): Set of pixel coordinates to excluded as future seeds.
+        _excluded_pixels (np.array): Boolean array with the pixel shape of the movie.
+            True for pixels that are excluded as future seeds.
         _grid_size (int): Number of pixels per dimension in a block.
         _keep_fraction (float): Percentage of candidate seed pixels to attempt for
             segmentation. All other candidate seed pixels are discarded.
@@ -66,7 +68,7 @@ class LocalCorrelationSeeder:
     def __init__(self, neighborhood_size, keep_fraction, padding, grid_size):
         """Initializes a LocalCorrelationSeeder object."""
         self._current_index = None
-        self._excluded_pixels = set()
+        self._excluded_pixels = None
         self._keep_fraction = keep_fraction
         self._movie = None
         self._neighborhood_size = neighborhood_size
@@ -97,18 +99,17 @@ class LocalCorrelationSeeder:
         neighbor_offsets = eight_neighborhood(num_dimensions, max_shift)
         # remove point as neighbor
         neighbor_offsets = neighbor_offsets - {(0,) * num_dimensions}
+        neighbor_offsets = np.array(sorted(neighbor_offsets), dtype=np.intp)
 
         mean_neighbor_corr = {}
 
         for pixel in generate_pixels(self._movie.pixel_shape):
             # compute neighbors
-            neighbors = add_offset_set_coordinates(neighbor_offsets, pixel)
+            neighbors = neighbor_offsets + pixel
 
-            # extract data for valid neighbors
-            valid_neighbors = [
-                neighbor
-                for neighbor in neighbors
-                if self._movie.is_valid_pixel_coordinate(neighbor)
+            # select valid neighbors
+            valid_neighbors = neighbors[
+                valid_pixels_mask(neighbors, self._movie.pixel_shape)
             ]
 
             # store average correlation
@@ -131,14 +132,20 @@ class LocalCorrelationSeeder:
         self.reset()
 
     def _compute_average_local_correlation(self, pixel, valid_neighbors):
-        """Compute average correlation between pixel and neighbors."""
+        """Compute average correlation between pixel and neighbors.
+
+        Args:
+            pixel (tuple): Pixel coordinate.
+            valid_neighbors (np.array): (N, D) array of the coordinates of the N
+                neighbors of the pixel.
+
+        Returns:
+            float: Average correlation between the pixel and its neighbors.
+        """
         pixel_data = self._movie[add_time_index(pixel)].reshape(1, -1)
 
-        # extract data for valid neighbors
-        neighbors_data = []
-        for neighbor in valid_neighbors:
-            neighbors_data.append(self._movie[add_time_index(neighbor)].reshape(1, -1))
-        neighbors_data = np.concatenate(neighbors_data, axis=0)
+        # extract data for valid neighbors in a single (N, T) array
+        neighbors_data = self._movie[add_time_index(tuple(valid_neighbors.T))].T
 
         # compute correlation to each neighbor (corrcoef concatenates the
         # two vectors so we extract last row except for last element)
@@ -197,15 +204,23 @@ class LocalCorrelationSeeder:
         Returns:
             None
         """
-        neighborhood = eight_neighborhood(self._movie.num_dimensions, self._padding)
+        if not pixels:
+            return
 
-        padded_pixel_sets = [
-            add_offset_set_coordinates(neighborhood, pixel) for pixel in pixels
-        ]
+        num_dimensions = self._movie.num_dimensions
+
+        coordinates = np.array(list(pixels), dtype=np.intp).reshape(-1, num_dimensions)
+        offsets = np.array(
+            list(eight_neighborhood(num_dimensions, self._padding)), dtype=np.intp
+        )
 
-        self._excluded_pixels = self._excluded_pixels.union(
-            pixels.union(*padded_pixel_sets)
+        # all offsets of all pixels as (num_pixels * num_offsets, num_dimensions) array
+        padded = (coordinates[:, np.newaxis, :] + offsets[np.newaxis, :, :]).reshape(
+            -1, num_dimensions
         )
+        valid = np.all((padded >= 0) & (padded < self._movie.pixel_shape), axis=1)
+
+        self._excluded_pixels[tuple(padded[valid].T)] = True
 
     def next(self):
         """Provides next seed pixel for segmentation.
@@ -221,7 +236,7 @@ class LocalCorrelationSeeder:
             center_seed = self._seeds[self._current_index]
             self._current_index += 1
 
-            if center_seed not in self._excluded_pixels:
+            if not self._excluded_pixels[center_seed]:
                 return center_seed
 
         return None
@@ -229,7 +244,8 @@ class LocalCorrelationSeeder:
     def reset(self):
         """Reinitialize the sequence of seed pixels and empties `_excluded_seeds`."""
         self._current_index = 0
-        self._excluded_pixels = set()
+        if self._movie is not None:
+            self._excluded_pixels = np.zeros(self._movie.pixel_shape, dtype=bool)
 
 
 class NegativeSeedSelector:
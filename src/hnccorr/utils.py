@@ -24,9 +24,12 @@
 """Helper functions for HNCcorr."""
 
 import glob
+import mmap
 import os
 from itertools import product
 
+import numpy as np
+
 
 def add_offset_set_coordinates(iterable, offset):
     """Adds a fixed offset to all pixel coordinates in a set.
@@ -64,6 +67,57 @@ def add_offset_to_coordinate(coordinate, offset):
     return tuple(a + b for a, b in zip(coordinate, offset))
 
 
+def _add_offset_2d(coordinate, offset):
+    """Specialization of :func:`add_offset_to_coordinate` for two dimensions."""
+    return (coordinate[0] + offset[0], coordinate[1] + offset[1])
+
+
+def _add_offset_3d(coordinate, offset):
+    """Specialization of :func:`add_offset_to_coordinate` for three dimensions."""
+    return (
+        coordinate[0] + offset[0],
+        coordinate[1] + offset[1],
+        coordinate[2] + offset[2],
+    )
+
+
+def add_offset_function(num_dims):
+    """Returns a function that offsets pixel coordinates of a given dimension.
+
+    For two and three dimensions, the returned function adds the coordinates without
+    looping. Otherwise, :func:`add_offset_to_coordinate` is returned.
+
+    Args:
+        num_dims (int): Number of dimensions of the coordinates.
+
+    Returns:
+        function: Function with the same signature as :func:`add_offset_to_coordinate`.
+    """
+    return {2: _add_offset_2d, 3: _add_offset_3d}.get(
+        num_dims, add_offset_to_coordinate
+    )
+
+
+def valid_pixels_mask(coordinates, shape):
+    """Checks for each pixel coordinate if it lies within an array of a given shape.
+
+    Args:
+        coordinates (np.array): (N, D) array of N pixel coordinates.
+        shape (tuple): Number of pixels in each of the D dimensions.
+
+    Returns:
+        np.array: Boolean array of length N. True for coordinates within the bounds.
+
+    Example:
+        .. code-block:: python
+
+            >>> valid_pixels_mask(np.array([[4, 9], [-1, 0], [4, 10]]), (5, 10))
+            array([ True, False, False])
+    """
+    coordinates = np.asarray(coordinates)
+    return np.all((coordinates >= 0) & (coordinates < shape), axis=1)
+
+
 def add_time_index(index):
     """Inserts a full slice as the first dimension of an index for e.g. numpy.
 
@@ -82,6 +136,48 @@ def add_time_index(index):
     return (slice(None, None),) + index
 
 
+def advise_sequential_access(file):
+    """Informs the operating system that a file will be read sequentially.
+
+    The hint enables more aggressive read-ahead. It has no effect on platforms without
+    ``posix_fadvise``, e.g. Windows and macOS.
+
+    Args:
+        file: Open file object backed by a file descriptor.
+
+    Returns:
+        None
+    """
+    if hasattr(os, "posix_fadvise"):
+        os.posix_fadvise(file.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+
+
+def advise_memory_access(array, pattern):
+    """Informs the operating system how a memory-mapped array will be accessed.
+
+    Sequential access enables aggressive read-ahead and early release of pages that have
+    been read. Random access disables read-ahead. Has no effect if the array is not
+    memory mapped or if the platform does not support ``madvise``.
+
+    Args:
+        array (np.array like): Array to advise on. Typically a ``np.memmap``.
+        pattern (str): Access pattern. Either ``"sequential"`` or ``"random"``.
+
+    Returns:
+        None
+
+    Raises:
+        ValueError: If the pattern is not ``"sequential"`` or ``"random"``.
+    """
+    if pattern not in ("sequential", "random"):
+        raise ValueError("pattern (%s) should be 'sequential' or 'random'." % pattern)
+
+    mapping = getattr(array, "_mmap", None)
+    advice = getattr(mmap, "MADV_" + pattern.upper(), None)
+    if mapping is not None and advice is not None:
+        mapping.madvise(advice)
+
+
 def list_images(folder):
     """Lists and sorts tiff images in a folder.
 
@@ -23,8 +23,11 @@
 # ENHANCEMENTS, OR MODIFICATIONS.
 import pytest
 import os
+import shutil
 import numpy as np
 from copy import copy, deepcopy
+import tifffile
+from PIL import Image
 from pytest_mock import mocker
 
 from hnccorr.movie import Movie, Patch, Subsampler
@@ -94,6 +97,43 @@ class TestMovie:
             data[i, :, :] = np.ones((5, 10)) * 2
         np.testing.assert_allclose(movie_from_tiff[:], data)
 
+    def test_movie_from_tiff_images_integer_dtype(self):
+        movie_from_tiff = Movie.from_tiff_images(
+            "Simple",
+            image_dir=str(os.path.join(TEST_DATA_DIR, "simple_movie_long")),
+            num_images=21,
+            subsample=2,
+            dtype=np.uint16,
+        )
+
+        # averages are rounded: 1.5 becomes 2
+        assert movie_from_tiff._data.dtype == np.uint16
+        np.testing.assert_allclose(movie_from_tiff[:], np.ones((11, 5, 10)) * 2)
+
+    def test_movie_from_tiff_images_integer_dtype_clips(self, tmp_path):
+        for i, value in enumerate([300, 100, 4095]):
+            tifffile.imwrite(
+                str(tmp_path / ("frame%05d.tiff" % i)),
+                np.ones((5, 10), np.uint16) * value,
+            )
+
+        movie_from_tiff = Movie.from_tiff_images(
+            "Clipped", str(tmp_path), num_images=3, subsample=1, dtype=np.uint8
+        )
+
+        assert movie_from_tiff._data.dtype == np.uint8
+        np.testing.assert_allclose(movie_from_tiff[:, 0, 0], [255, 100, 255])
+
+    def test_movie_from_tiff_images_float16(self):
+        with pytest.raises(ValueError):
+            Movie.from_tiff_images(
+                "Simple",
+                image_dir=str(os.path.join(TEST_DATA_DIR, "simple_movie")),
+                num_images=3,
+                subsample=1,
+                dtype=np.float16,
+            )
+
     def test_movie_from_tiff_images_memmap(self, movie_data):
         """
         Movie consists of three images of 5 x 10 pixels. All pixels in the first
@@ -111,6 +151,132 @@ class TestMovie:
         # compare data of movie from_tiff and direct initialization.
         np.testing.assert_allclose(movie_from_tiff[:], movie_data)
 
+    def test_movie_get_tiff_images_and_size(self):
+        images, data_size, first_frame = Movie._get_tiff_images_and_size(
+            os.path.join(TEST_DATA_DIR, "simple_movie"), 3
+        )
+
+        assert len(images) == 3
+        assert data_size == (3, 5, 10)
+        np.testing.assert_equal(first_frame, np.ones((5, 10)))
+
+    def test_movie_from_tiff_images_reads_first_image_once(self, mocker):
+        read_file = mocker.spy(Movie, "_read_file")
+
+        Movie.from_tiff_images(
+            "Simple",
+            image_dir=str(os.path.join(TEST_DATA_DIR, "simple_movie")),
+            num_images=3,
+            subsample=1,
+        )
+
+        assert read_file.call_count == 3
+
+    def test_movie_decode_images_preserves_order(self, tmp_path):
+        # more images than frame buffers, such that the buffers are reused
+        num_images = 12
+        images = []
+        for i in range(num_images):
+            images.append(str(tmp_path / ("frame%05d.tiff" % i)))
+            tifffile.imwrite(images[-1], np.ones((5, 10), np.uint16) * i)
+
+        frames = []
+        for value, frame in enumerate(Movie._decode_images(images, num_workers=2)):
+            np.testing.assert_equal(frame, np.ones((5, 10)) * value)
+            frames.append(frame)
+
+        assert len(frames) == num_images
+        # read_ahead is 4 for two workers, so every fifth frame reuses a buffer
+        assert np.shares_memory(frames[0], frames[5])
+        assert not np.shares_memory(frames[0], frames[4])
+
+    def test_movie_decode_images_raises_read_errors(self, tmp_path):
+        with pytest.raises(FileNotFoundError):
+            list(Movie._decode_images([str(tmp_path / "missing.tiff")], num_workers=2))
+
+    def test_movie_read_file(self):
+        filename = os.path.join(TEST_DATA_DIR, "simple_movie", "simple_movie00001.tiff")
+
+        with open(filename, "rb") as file:
+            assert Movie._read_file(filename) == file.read()
+
+    def test_movie_decode_frame(self):
+        frame = Movie._decode_frame(
+            Movie._read_file(
+                os.path.join(TEST_DATA_DIR, "simple_movie", "simple_movie00001.tiff")
+            )
+        )
+
+        assert frame.dtype == np.uint16
+        np.testing.assert_equal(frame, np.ones((5, 10)) * 2)
+
+    def test_movie_decode_frame_into_buffer(self):
+        contents = Movie._read_file(
+            os.path.join(TEST_DATA_DIR, "simple_movie", "simple_movie00002.tiff")
+        )
+        buffer = np.zeros((5, 10), np.uint16)
+
+        frame = Movie._decode_frame(contents, out=buffer)
+
+        assert np.shares_memory(frame, buffer)
+        np.testing.assert_equal(buffer, np.ones((5, 10)) * 3)
+
+    def test_movie_decode_frame_ignores_mismatched_buffer(self):
+        contents = Movie._read_file(
+            os.path.join(TEST_DATA_DIR, "simple_movie", "simple_movie00002.tiff")
+        )
+        buffer = np.zeros((5, 10), np.float32)
+
+        frame = Movie._decode_frame(contents, out=buffer)
+
+        assert not np.shares_memory(frame, buffer)
+        np.testing.assert_equal(frame, np.ones((5, 10)) * 3)
+
+    def test_movie_decode_frame_lzw_compressed(self, tmp_path):
+        filename = str(tmp_path / "frame.tiff")
+        Image.fromarray(np.ones((5, 10), np.uint16) * 700).save(
+            filename, compression="tiff_lzw"
+        )
+
+        frame = Movie._decode_frame(Movie._read_file(filename))
+
+        np.testing.assert_equal(frame, np.ones((5, 10)) * 700)
+
+    def test_movie_decode_frame_falls_back_to_pillow(self, tmp_path):
+        filename = str(tmp_path / "frame.tiff")
+        Image.fromarray(np.ones((5, 10), np.uint8) * 7).save(filename)
+
+        np.testing.assert_equal(
+            Movie._decode_frame(Movie._read_file(filename)), np.ones((5, 10)) * 7
+        )
+
+    @pytest.mark.parametrize("memmap", [False, True])
+    @pytest.mark.parametrize("layout", ["TYX", "YXT"])
+    def test_movie_raw_round_trip(self, movie_data, tmp_path, memmap, layout):
+        filename = str(tmp_path / "movie.raw")
+        Movie("Simple", movie_data, layout=layout).cache_to_raw(filename)
+
+        movie = Movie.from_raw("Raw", filename, (3, 5, 10), memmap=memmap)
+
+        assert movie.name == "Raw"
+        assert movie.dtype == np.float32
+        np.testing.assert_allclose(movie[:], movie_data)
+
+    def test_movie_from_raw_tiff_memmap(self, movie_data, tmp_path):
+        source_dir = os.path.join(TEST_DATA_DIR, "simple_movie")
+        for filename in os.listdir(source_dir):
+            if filename.endswith(".tiff"):
+                shutil.copy(os.path.join(source_dir, filename), str(tmp_path))
+        Movie.from_tiff_images(
+            "Simple", str(tmp_path), num_images=3, memmap=True, subsample=1
+        )
+
+        movie = Movie.from_raw(
+            "Simple", str(tmp_path / "Simple.npy"), (3, 5, 10), memmap=True
+        )
+
+        np.testing.assert_allclose(movie[:], movie_data)
+
     def test_movie_name(self, M):
         assert M.name == "Simple"
 
@@ -123,6 +289,9 @@ class TestMovie:
     def test_movie_data_size(self, M):
         assert M.data_size == (3, 5, 10)
 
+    def test_movie_dtype(self, M):
+        assert M.dtype == np.float32
+
     def test_data_access_float64(self, M):
         assert M[:].dtype == np.float64
 
@@ -138,10 +307,41 @@ class TestMovie:
     def test_movie_extract_valid_pixels(self, M):
         assert M.extract_valid_pixels({(0, 0), (-1, 0), (4, 10)}) == {(0, 0)}
 
+    def test_movie_extract_valid_pixels_empty(self, M):
+        assert M.extract_valid_pixels(set()) == set()
+
+    def test_movie_extract_valid_pixels_wrong_dimension(self, M):
+        assert M.extract_valid_pixels({(0,), (4,)}) == set()
+
+    def test_movie_extract_valid_pixels_mixed_dimensions(self, M):
+        assert M.extract_valid_pixels({(0, 0), (1,), (4, 10), (1, 2, 3)}) == {(0, 0)}
+
     def test_movie_get_item(self, M, movie_data):
         assert M[0, 0, 0] == 1.0
         np.testing.assert_allclose(M[2, :, :], movie_data[2, :, :])
 
+    def test_movie_layout_yxt(self, movie_data):
+        movie = Movie("Simple", movie_data, layout="YXT")
+
+        assert movie._data.shape == (5, 10, 3)
+        assert movie._data.flags["C_CONTIGUOUS"]
+        assert movie.data_size == (3, 5, 10)
+        assert movie.num_frames == 3
+        assert movie.pixel_shape == (5, 10)
+        np.testing.assert_allclose(movie[:], movie_data)
+        np.testing.assert_allclose(movie[:, 2, 3], [1.0, 2.0, 3.0])
+
+    def test_movie_invalid_layout(self, movie_data):
+        with pytest.raises(ValueError):
+            Movie("Simple", movie_data, layout="XYT")
+
+    def test_movie_set_access_pattern(self, M, mocker):
+        advise = mocker.patch("hnccorr.movie.advise_memory_access")
+
+        M.set_access_pattern("random")
+
+        advise.assert_called_once_with(M._data, "random")
+
     def test_movie_init_with_memmap(self, movie_data):
         # prepare memmapped file
         filename = os.path.join(TEST_DATA_DIR, "test_memdata.npy")
@@ -167,6 +367,19 @@ class TestPatch:
     def test_patch_data(self, simple_patch, MM):
         np.testing.assert_equal(simple_patch[:], MM[:, 3:10])
 
+    def test_patch_data_loaded_on_first_access(self, simple_patch, MM):
+        assert simple_patch._data is None
+
+        np.testing.assert_equal(simple_patch[:, 0], MM[:, 3])
+        assert simple_patch._data is not None
+
+    @pytest.mark.parametrize(
+        "center_seed, coordinate_offset",
+        [((5, 5), (4, 4)), ((0, 0), (0, 0)), ((9, 8), (7, 7)), ((0, 9), (0, 7))],
+    )
+    def test_patch_coordinate_offset(self, center_seed, coordinate_offset, MM2):
+        assert Patch(MM2, center_seed, 3)._coordinate_offset == coordinate_offset
+
     def test_patch_even_windowsize(self, MM):
         with pytest.raises(ValueError):
             Patch(MM, (5,), 6)
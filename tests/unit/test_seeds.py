@@ -80,6 +80,23 @@ class TestLocalCorrelationSeeder:
         LCS.exclude_pixels({(6,)})
         assert LCS.next() is None
 
+    def test_seeder_exclude_pixels_empty(self, LCS, MM):
+        LCS.select_seeds(MM)
+        LCS.exclude_pixels(set())
+        assert LCS.next() == (9,)
+
+    def test_seeder_exclude_pixels_2d(self, MM2):
+        lcs = LocalCorrelationSeeder(3, 1.0, 1, 1)
+        lcs._movie = MM2
+        lcs.reset()
+
+        lcs.exclude_pixels({(0, 0), (5, 5)})
+
+        assert lcs._excluded_pixels.sum() == 4 + 9
+        assert lcs._excluded_pixels[1, 1]
+        assert lcs._excluded_pixels[6, 4]
+        assert not lcs._excluded_pixels[2, 0]
+
     def test_seeder_reset_excluded_pixels(self, LCS, MM):
         LCS.select_seeds(MM)
         assert LCS.next() == (9,)
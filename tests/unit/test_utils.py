@@ -22,17 +22,23 @@
 # IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
 # ENHANCEMENTS, OR MODIFICATIONS.
 import os
+import numpy as np
+import pytest
 
 from conftest import TEST_DATA_DIR
 
 from hnccorr.utils import (
     four_neighborhood,
     generate_pixels,
+    add_offset_function,
     add_offset_to_coordinate,
     add_offset_set_coordinates,
     add_time_index,
+    advise_memory_access,
+    advise_sequential_access,
     list_images,
     eight_neighborhood,
+    valid_pixels_mask,
 )
 
 
@@ -40,6 +46,15 @@ def test_add_offset():
     assert add_offset_to_coordinate((1, 2), (3, 4)) == (4, 6)
 
 
+@pytest.mark.parametrize(
+    "coordinate, offset, expected",
+    [((1,), (3,), (4,)), ((1, 2), (3, 4), (4, 6)), ((1, 2, 3), (3, 4, 5), (4, 6, 8))],
+)
+def test_add_offset_function(coordinate, offset, expected):
+    add_offset = add_offset_function(len(coordinate))
+    assert add_offset(coordinate, offset) == expected
+
+
 def test_add_set_offset():
     assert add_offset_set_coordinates({(0, 1), (1, 1)}, (2, 2)) == {(2, 3), (3, 3)}
 
@@ -48,6 +63,35 @@ def test_add_time_index():
     assert add_time_index((5, 4)) == (slice(None, None), 5, 4)
 
 
+def test_advise_sequential_access():
+    filename = os.path.join(TEST_DATA_DIR, "simple_movie", "simple_movie00000.tiff")
+    with open(filename, "rb") as file:
+        advise_sequential_access(file)
+
+        assert file.tell() == 0
+
+
+def test_advise_memory_access(tmp_path):
+    array = np.memmap(str(tmp_path / "data.npy"), np.uint16, mode="w+", shape=(3, 5))
+
+    advise_memory_access(array, "sequential")
+    advise_memory_access(array, "random")
+    advise_memory_access(np.zeros((3, 5)), "random")
+
+
+def test_advise_memory_access_invalid_pattern():
+    with pytest.raises(ValueError):
+        advise_memory_access(np.zeros((3, 5)), "backwards")
+
+
+def test_valid_pixels_mask():
+    coordinates = np.array([[4, 9], [-1, 0], [4, 10], [0, 0]])
+
+    np.testing.assert_equal(
+        valid_pixels_mask(coordinates, (5, 10)), [True, False, False, True]
+    )
+
+
 def test_list_images():
     images = list_images(TEST_DATA_DIR)
     expected_images = map(